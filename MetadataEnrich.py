@@ -0,0 +1,378 @@
+import json
+import os
+import random
+import re
+import sqlite3
+import time
+
+import requests
+from rapidfuzz import fuzz
+
+# Konfigurasi enrichment metadata
+MIRROR_DB = "metadata_mirror.db"
+CROSSREF_URL = "https://api.crossref.org/works"
+CROSSREF_MAILTO = ""  # Isi email agar masuk polite pool CrossRef
+BATCH_SIZE = 20  # Jumlah DOI per request CrossRef
+TITLE_MATCH_THRESHOLD = 90  # Kemiripan minimal judul hasil pencarian CrossRef
+REQUEST_DELAY = (1, 3)  # Jeda antar request CrossRef
+MISS_TTL = 30 * 24 * 60 * 60  # Detik sebelum publikasi yang tidak ditemukan dicari ulang
+MIN_TITLE_WORDS = 4  # Judul lebih pendek (misal "Kata Pengantar", "Editorial") tidak dicocokkan lewat judul
+YEAR_TOLERANCE = 1  # Selisih tahun Scholar vs CrossRef yang masih diterima
+AUTHOR_OVERLAP = 0.6  # Porsi minimal penulis Scholar yang harus ada di daftar penulis baru
+
+DOI_PATTERN = re.compile(r'10\.\d{4,9}/[^\s"<>?#]+', re.IGNORECASE)
+# Akhiran URL penerbit yang bukan bagian DOI, misal .../doi/10.1002/abc.123/full
+DOI_URL_SUFFIX = re.compile(r'(/(full|abstract|pdf|epdf|pdfdirect|html|fulltext|references))+$|\.pdf$',
+                            re.IGNORECASE)
+
+
+def normalize_doi(doi):
+    """Ambil DOI dari string/URL dalam bentuk huruf kecil, None jika tidak ada"""
+    match = DOI_PATTERN.search(doi or '')
+    if not match:
+        return None
+    return DOI_URL_SUFFIX.sub('', match.group(0).rstrip('.,;')).lower()
+
+
+def normalize_title(title):
+    """Normalisasi judul untuk kunci cache"""
+    return ' '.join(re.sub(r'[^\w\s]', ' ', (title or '').lower()).split())
+
+
+def to_year(value):
+    """Ambil tahun (int) dari nilai apa pun, None jika tidak ada"""
+    match = re.search(r'\b(19|20)\d{2}\b', str(value or ''))
+    return int(match.group(0)) if match else None
+
+
+def names_match(a, b):
+    """Cocokkan dua nama: nama belakang mirip dan inisial depan sama (jika ada)"""
+    ta, tb = normalize_title(a).split(), normalize_title(b).split()
+    if not ta or not tb or fuzz.ratio(ta[-1], tb[-1]) < 90:
+        return False
+    return len(ta) == 1 or len(tb) == 1 or ta[0][0] == tb[0][0]
+
+
+def authors_consistent(scholar_authors, new_authors):
+    """True jika sebagian besar penulis Scholar (yang mungkin terpotong) ada di daftar baru"""
+    names = [a for a in scholar_authors if a.strip(' .…')]
+    if not names:
+        return True
+    matched = sum(any(names_match(a, b) for b in new_authors) for a in names)
+    return matched / len(names) >= AUTHOR_OVERLAP
+
+
+def title_usable(title):
+    """Judul cukup panjang untuk dicocokkan tanpa DOI"""
+    return len(normalize_title(title).split()) >= MIN_TITLE_WORDS
+
+
+def title_match_ok(record, item):
+    """Terima hasil pencarian judul hanya jika judul, tahun, dan penulis konsisten dengan item"""
+    if not record or not title_usable(item.get('title')):
+        return False
+    if fuzz.token_sort_ratio(normalize_title(record.get('title')),
+                             normalize_title(item.get('title'))) < TITLE_MATCH_THRESHOLD:
+        return False
+    year, record_year = to_year(item.get('year')), to_year(record.get('year'))
+    if year and record_year and abs(year - record_year) > YEAR_TOLERANCE:
+        return False
+    return authors_consistent(item.get('authors') or [], record.get('authors') or [])
+
+
+def item_key(item):
+    """Kunci cache untuk satu item: DOI jika ada, selain itu judul"""
+    doi = normalize_doi(item.get('doi'))
+    if doi:
+        return f"doi:{doi}"
+    title = normalize_title(item.get('title'))
+    return f"title:{title}" if title else None
+
+
+def connect_mirror(db_path=MIRROR_DB):
+    """Buka mirror cache SQLite dan pastikan tabel metadata tersedia"""
+    conn = sqlite3.connect(db_path, timeout=60)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS metadata (
+            kunci TEXT PRIMARY KEY,
+            doi TEXT,
+            title TEXT,
+            authors TEXT,
+            journal TEXT,
+            year INTEGER,
+            source TEXT,
+            fetched_at REAL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS miss (
+            kunci TEXT,
+            source TEXT,
+            fetched_at REAL,
+            PRIMARY KEY (kunci, source)
+        )
+    """)
+    return conn
+
+
+def _row_to_record(row):
+    kunci, doi, title, authors, journal, year, source = row
+    return {
+        'kunci': kunci,
+        'doi': doi,
+        'title': title,
+        'authors': json.loads(authors) if authors is not None else None,
+        'journal': journal,
+        'year': year,
+        'source': source
+    }
+
+
+def mirror_get(keys, db_path=MIRROR_DB):
+    """Baca record yang ditemukan (ada daftar penulis) dari mirror"""
+    keys = [k for k in set(keys) if k]
+    found = {}
+    conn = connect_mirror(db_path)
+    try:
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            rows = conn.execute(
+                "SELECT kunci, doi, title, authors, journal, year, source FROM metadata "
+                f"WHERE authors IS NOT NULL AND kunci IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall()
+            found.update({row[0]: _row_to_record(row) for row in rows})
+    finally:
+        conn.close()
+    return found
+
+
+def mirror_put(records, db_path=MIRROR_DB):
+    """Simpan record yang ditemukan ke mirror cache"""
+    now = time.time()
+    conn = connect_mirror(db_path)
+    try:
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO metadata "
+                "(kunci, doi, title, authors, journal, year, source, fetched_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(r['kunci'], r.get('doi'), r.get('title'),
+                  json.dumps(r['authors'], ensure_ascii=False),
+                  r.get('journal'), r.get('year'), r.get('source'), now)
+                 for r in records if r.get('authors')]
+            )
+    finally:
+        conn.close()
+
+
+def misses_get(keys, source, db_path=MIRROR_DB, ttl=MISS_TTL):
+    """Kunci yang belum lama ini dicari di source yang sama tapi tidak ditemukan"""
+    keys = [k for k in set(keys) if k]
+    found = set()
+    conn = connect_mirror(db_path)
+    try:
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            rows = conn.execute(
+                "SELECT kunci FROM miss WHERE source = ? AND fetched_at >= ? "
+                f"AND kunci IN ({','.join('?' * len(chunk))})", [source, time.time() - ttl] + chunk
+            ).fetchall()
+            found.update(row[0] for row in rows)
+    finally:
+        conn.close()
+    return found
+
+
+def misses_put(keys, source, db_path=MIRROR_DB):
+    """Catat kunci yang tidak ditemukan di source"""
+    now = time.time()
+    conn = connect_mirror(db_path)
+    try:
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO miss (kunci, source, fetched_at) VALUES (?, ?, ?)",
+                             [(k, source, now) for k in keys])
+    finally:
+        conn.close()
+
+
+def lookup(title=None, doi=None, year=None, db_path=MIRROR_DB):
+    """Cari penulis lengkap di mirror saja (tanpa jaringan), None jika belum ada"""
+    key = item_key({'doi': doi, 'title': title})
+    if not key or not os.path.exists(db_path):
+        return None
+    if key.startswith('title:') and not title_usable(title):
+        return None
+    record = mirror_get([key], db_path).get(key)
+    if not record or not record['authors']:
+        return None
+    year, record_year = to_year(year), to_year(record['year'])
+    if year and record_year and abs(year - record_year) > YEAR_TOLERANCE:
+        return None
+    return record
+
+
+def crossref_record(item):
+    """Ubah satu item CrossRef menjadi record mirror"""
+    authors = []
+    for a in item.get('author', []):
+        name = ' '.join(filter(None, [a.get('given'), a.get('family')])) or a.get('name', '')
+        if name:
+            authors.append(name)
+    year = None
+    for field in ('issued', 'published-print', 'published-online'):
+        parts = (item.get(field) or {}).get('date-parts') or [[None]]
+        if parts[0] and parts[0][0]:
+            year = parts[0][0]
+            break
+    return {
+        'doi': normalize_doi(item.get('DOI')),
+        'title': (item.get('title') or [''])[0],
+        'authors': authors,
+        'journal': (item.get('container-title') or [''])[0],
+        'year': year
+    }
+
+
+def _crossref_get(params):
+    if CROSSREF_MAILTO:
+        params['mailto'] = CROSSREF_MAILTO
+    response = requests.get(CROSSREF_URL, params=params, timeout=30)
+    response.raise_for_status()
+    time.sleep(random.uniform(*REQUEST_DELAY))
+    return response.json().get('message', {}).get('items', [])
+
+
+def _crossref_title(item):
+    """Cari judul item di CrossRef, None jika tidak ada kandidat yang lolos title_match_ok"""
+    if not title_usable(item.get('title')):
+        return None
+    for found in _crossref_get({'query.bibliographic': item['title'], 'rows': 5}):
+        record = crossref_record(found)
+        if title_match_ok(record, item):
+            return record
+    return None
+
+
+def crossref_source(items):
+    """Sumber metadata CrossRef: DOI di-batch lewat filter, sisanya lewat query.bibliographic"""
+    # Item yang kena error jaringan tidak dimasukkan ke hasil agar tidak dicatat sebagai miss
+    by_doi = {}
+    error_dois = set()
+    dois = sorted({normalize_doi(i.get('doi')) for i in items} - {None})
+    for i in range(0, len(dois), BATCH_SIZE):
+        batch = dois[i:i + BATCH_SIZE]
+        try:
+            for found in _crossref_get({'filter': ','.join(f"doi:{d}" for d in batch),
+                                        'rows': len(batch)}):
+                record = crossref_record(found)
+                by_doi[record['doi']] = record
+        except Exception as e:
+            print(f"    🚨 Gagal mengambil batch DOI CrossRef: {str(e)}")
+            error_dois.update(batch)
+
+    results = {}
+    for item in items:
+        doi = normalize_doi(item.get('doi'))
+        if doi in error_dois:
+            continue
+        record = by_doi.get(doi) if doi else None
+        # DOI dari pub_url bisa salah, jadi tetap coba lewat judul
+        if record is None and item.get('title'):
+            try:
+                record = _crossref_title(item)
+            except Exception as e:
+                print(f"    🚨 Gagal mencari judul di CrossRef: {str(e)}")
+                continue
+        results[item_key(item)] = record
+    return results
+
+
+def make_dump_source(path):
+    """Sumber metadata dari dump lokal (JSON atau SQLite) sebagai pengganti CrossRef"""
+    records = []
+    if path.lower().endswith('.json'):
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            data = data.get('message', {}).get('items', data.get('items', []))
+        for entry in data:
+            # Item CrossRef punya 'title' berupa list dan 'author' berisi dict; record mirror punya 'authors'
+            if isinstance(entry.get('title'), list) or 'author' in entry:
+                records.append(crossref_record(entry))
+            else:
+                records.append(entry)
+    else:
+        conn = sqlite3.connect(path)
+        try:
+            rows = conn.execute(
+                "SELECT kunci, doi, title, authors, journal, year, source FROM metadata "
+                "WHERE authors IS NOT NULL"
+            ).fetchall()
+        finally:
+            conn.close()
+        records = [_row_to_record(row) for row in rows]
+
+    index = {}
+    for record in records:
+        for key in (item_key({'doi': record.get('doi')}), item_key({'title': record.get('title')})):
+            if key:
+                index[key] = record
+
+    def dump_source(items):
+        results = {}
+        for item in items:
+            record = index.get(item_key({'doi': item.get('doi')}))
+            if record is None:
+                record = index.get(item_key({'title': item.get('title')}))
+                record = record if title_match_ok(record, item) else None
+            results[item_key(item)] = record
+        return results
+
+    # Dump hanya potongan data, jadi miss dari dump tidak boleh menutup sumber lain
+    dump_source.cache_misses = False
+    dump_source.__name__ = f"dump:{os.path.basename(path)}"
+    return dump_source
+
+
+def resolve(items, source=crossref_source, db_path=MIRROR_DB, batch_size=BATCH_SIZE):
+    """Resolusi metadata item (dict 'doi'/'title') lewat mirror, sisanya ke source per batch"""
+    wanted = {}
+    for item in items:
+        key = item_key(item)
+        if key:
+            wanted.setdefault(key, item)
+
+    source_name = getattr(source, '__name__', 'source')
+    cache_misses = getattr(source, 'cache_misses', True)
+    resolved = mirror_get(wanted, db_path)
+    known_misses = misses_get(set(wanted) - set(resolved), source_name, db_path) if cache_misses else set()
+    missing = [wanted[k] for k in wanted if k not in resolved and k not in known_misses]
+    print(f"📚 {len(wanted)} publikasi unik, {len(resolved)} dari mirror, "
+          f"{len(known_misses)} miss tersimpan, {len(missing)} dicari")
+
+    for i in range(0, len(missing), batch_size):
+        batch = missing[i:i + batch_size]
+        fetched = source(batch)
+        to_store = []
+        not_found = []
+        for key, record in fetched.items():
+            if key is None:
+                continue
+            if not record or not record.get('authors'):
+                not_found.append(key)
+                continue
+            record = dict(record, kunci=key, source=source_name)
+            to_store.append(record)
+            # Simpan juga dengan kunci judul agar lookup dari Scholar (tanpa DOI) kena cache
+            title = wanted.get(key, {}).get('title') or record.get('title')
+            title_key = item_key({'title': title})
+            if title_key and title_key != key and title_usable(title):
+                to_store.append(dict(record, kunci=title_key))
+        mirror_put(to_store, db_path)
+        if cache_misses:
+            misses_put(not_found, source_name, db_path)
+        resolved.update({r['kunci']: r for r in to_store})
+        print(f"   🔎 Batch {i // batch_size + 1}: {len(to_store)} record disimpan ke mirror, "
+              f"{len(not_found)} tidak ditemukan")
+
+    return {k: r for k, r in resolved.items() if k in wanted}
@@ -0,0 +1,301 @@
+import hmac
+import ipaddress
+import json
+import os
+import sqlite3
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+# Konfigurasi antrian kerja
+# ANTRIAN berisi path file SQLite (satu mesin) atau URL layanan antrian,
+# misal http://10.0.0.5:8765, agar worker di mesin/IP lain bisa ikut
+QUEUE_DB = os.environ.get('ANTRIAN', "antrian.db")
+QUEUE_TOKEN = os.environ.get('ANTRIAN_TOKEN', '')  # Token bersama server & worker (opsional)
+QUEUE_PORT = 8765
+LEASE_TIMEOUT = 30 * 60  # Detik sebelum lease dianggap kedaluwarsa, diperpanjang lewat renew()
+MAX_ATTEMPTS = 3  # Percobaan maksimal sebelum item ditandai gagal
+BACKOFF_BASE = 5 * 60  # Jeda awal sebelum item gagal boleh diambil lagi (naik 2x per percobaan)
+BACKOFF_MAX = 2 * 60 * 60  # Jeda maksimal
+
+
+class LeaseLost(Exception):
+    """Lease sudah kedaluwarsa dan diambil worker lain"""
+
+
+def is_remote(db_path):
+    """True jika antrian berupa layanan HTTP, bukan file SQLite lokal"""
+    return str(db_path).startswith(('http://', 'https://'))
+
+
+def _remote(url, action, **args):
+    """Panggil satu aksi di layanan antrian"""
+    request = urllib.request.Request(
+        f"{url.rstrip('/')}/{action}",
+        data=json.dumps(args).encode('utf-8'),
+        headers={'Content-Type': 'application/json', 'X-Antrian-Token': QUEUE_TOKEN}
+    )
+    with urllib.request.urlopen(request, timeout=120) as response:
+        return json.loads(response.read().decode('utf-8'))
+
+
+def connect(db_path=QUEUE_DB):
+    """Buka koneksi SQLite dan pastikan tabel antrian tersedia"""
+    conn = sqlite3.connect(db_path, timeout=60, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS antrian (
+            scholar_id TEXT PRIMARY KEY,
+            status TEXT NOT NULL DEFAULT 'pending',
+            worker TEXT,
+            lease_until REAL,
+            not_before REAL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            hasil TEXT,
+            updated_at REAL
+        )
+    """)
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(antrian)")}
+    if 'not_before' not in columns:
+        conn.execute("ALTER TABLE antrian ADD COLUMN not_before REAL")
+    return conn
+
+
+def backoff(attempts):
+    """Jeda (detik) sebelum item yang gagal boleh diambil lagi"""
+    return min(BACKOFF_BASE * 2 ** max(attempts - 1, 0), BACKOFF_MAX)
+
+
+def enqueue(scholar_ids, db_path=QUEUE_DB):
+    """Masukkan scholar_id ke antrian, ID yang sudah ada tidak diulang"""
+    if is_remote(db_path):
+        return _remote(db_path, 'enqueue', scholar_ids=list(scholar_ids))
+    conn = connect(db_path)
+    try:
+        now = time.time()
+        before = conn.total_changes
+        conn.execute("BEGIN IMMEDIATE")
+        conn.executemany(
+            "INSERT OR IGNORE INTO antrian (scholar_id, updated_at) VALUES (?, ?)",
+            [(sid, now) for sid in scholar_ids if sid]
+        )
+        conn.execute("COMMIT")
+        return conn.total_changes - before
+    finally:
+        conn.close()
+
+
+def requeue_expired(conn, now=None):
+    """Kembalikan lease yang kedaluwarsa ke antrian (atau tandai gagal)"""
+    now = time.time() if now is None else now
+    conn.execute(
+        "UPDATE antrian SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+        "worker = NULL, lease_until = NULL, error = 'lease kedaluwarsa', updated_at = ? "
+        "WHERE status = 'leased' AND lease_until < ?",
+        (MAX_ATTEMPTS, now, now)
+    )
+
+
+def lease(worker_id, db_path=QUEUE_DB, timeout=LEASE_TIMEOUT):
+    """Ambil satu scholar_id dari antrian untuk worker ini, None jika tidak ada yang siap"""
+    if is_remote(db_path):
+        return _remote(db_path, 'lease', worker_id=worker_id, timeout=timeout)
+    conn = connect(db_path)
+    try:
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        requeue_expired(conn, now)
+        row = conn.execute(
+            "SELECT scholar_id FROM antrian WHERE status = 'pending' "
+            "AND (not_before IS NULL OR not_before <= ?) "
+            "ORDER BY attempts, updated_at LIMIT 1", (now,)
+        ).fetchone()
+        if row is None:
+            conn.execute("COMMIT")
+            return None
+        conn.execute(
+            "UPDATE antrian SET status = 'leased', worker = ?, lease_until = ?, "
+            "attempts = attempts + 1, updated_at = ? WHERE scholar_id = ?",
+            (worker_id, now + timeout, now, row[0])
+        )
+        conn.execute("COMMIT")
+        return row[0]
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+
+def renew(scholar_id, worker_id, db_path=QUEUE_DB, timeout=LEASE_TIMEOUT):
+    """Perpanjang lease (heartbeat), False jika lease sudah bukan milik worker ini"""
+    if is_remote(db_path):
+        return _remote(db_path, 'renew', scholar_id=scholar_id, worker_id=worker_id, timeout=timeout)
+    conn = connect(db_path)
+    try:
+        now = time.time()
+        cur = conn.execute(
+            "UPDATE antrian SET lease_until = ?, updated_at = ? "
+            "WHERE scholar_id = ? AND worker = ? AND status = 'leased'",
+            (now + timeout, now, scholar_id, worker_id)
+        )
+        return cur.rowcount == 1
+    finally:
+        conn.close()
+
+
+def complete(scholar_id, worker_id, rows, db_path=QUEUE_DB, error=None):
+    """Laporkan hasil satu profil, False jika lease sudah bukan milik worker ini"""
+    # Jika error diisi (sebagian publikasi gagal), hasil tetap disimpan dengan status 'partial'
+    if is_remote(db_path):
+        return _remote(db_path, 'complete', scholar_id=scholar_id, worker_id=worker_id,
+                       rows=json.loads(json.dumps(rows, ensure_ascii=False, default=str)),
+                       error=error)
+    conn = connect(db_path)
+    try:
+        cur = conn.execute(
+            "UPDATE antrian SET status = ?, hasil = ?, error = ?, lease_until = NULL, "
+            "updated_at = ? WHERE scholar_id = ? AND worker = ? AND status = 'leased'",
+            ('partial' if error else 'done', json.dumps(rows, ensure_ascii=False, default=str),
+             error, time.time(), scholar_id, worker_id)
+        )
+        return cur.rowcount == 1
+    finally:
+        conn.close()
+
+
+def fail(scholar_id, worker_id, error, db_path=QUEUE_DB):
+    """Laporkan kegagalan, item kembali ke antrian setelah backoff sampai MAX_ATTEMPTS"""
+    if is_remote(db_path):
+        return _remote(db_path, 'fail', scholar_id=scholar_id, worker_id=worker_id, error=str(error))
+    conn = connect(db_path)
+    try:
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute(
+            "SELECT attempts FROM antrian WHERE scholar_id = ? AND worker = ? AND status = 'leased'",
+            (scholar_id, worker_id)
+        ).fetchone()
+        if row is None:
+            conn.execute("COMMIT")
+            return False
+        conn.execute(
+            "UPDATE antrian SET status = ?, worker = NULL, lease_until = NULL, not_before = ?, "
+            "error = ?, updated_at = ? WHERE scholar_id = ?",
+            ('failed' if row[0] >= MAX_ATTEMPTS else 'pending', now + backoff(row[0]),
+             str(error), now, scholar_id)
+        )
+        conn.execute("COMMIT")
+        return True
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+
+def reset_failed(db_path=QUEUE_DB, include_partial=False):
+    """Kembalikan item 'failed' (dan opsional 'partial') ke antrian dengan percobaan dari nol"""
+    if is_remote(db_path):
+        return _remote(db_path, 'reset_failed', include_partial=include_partial)
+    statuses = ('failed', 'partial') if include_partial else ('failed',)
+    conn = connect(db_path)
+    try:
+        # Hasil 'partial' tetap disimpan sampai diganti hasil percobaan berikutnya
+        cur = conn.execute(
+            "UPDATE antrian SET status = 'pending', attempts = 0, not_before = NULL, "
+            f"updated_at = ? WHERE status IN ({','.join('?' * len(statuses))})",
+            (time.time(),) + statuses
+        )
+        return cur.rowcount
+    finally:
+        conn.close()
+
+
+def collect_results(db_path=QUEUE_DB):
+    """Gabungkan semua baris hasil yang tersimpan (selesai, sebagian, atau sebagian yang diulang)"""
+    if is_remote(db_path):
+        return _remote(db_path, 'collect_results')
+    conn = connect(db_path)
+    try:
+        rows = []
+        for (hasil,) in conn.execute(
+                "SELECT hasil FROM antrian WHERE hasil IS NOT NULL ORDER BY scholar_id"):
+            rows.extend(json.loads(hasil or '[]'))
+        return rows
+    finally:
+        conn.close()
+
+
+def queue_stats(db_path=QUEUE_DB):
+    """Hitung jumlah item per status"""
+    if is_remote(db_path):
+        return _remote(db_path, 'queue_stats')
+    conn = connect(db_path)
+    try:
+        return dict(conn.execute("SELECT status, COUNT(*) FROM antrian GROUP BY status").fetchall())
+    finally:
+        conn.close()
+
+
+ACTIONS = {
+    'enqueue': enqueue,
+    'lease': lease,
+    'renew': renew,
+    'complete': complete,
+    'fail': fail,
+    'reset_failed': reset_failed,
+    'collect_results': collect_results,
+    'queue_stats': queue_stats,
+}
+
+
+def is_loopback(host):
+    """True jika host hanya bisa diakses dari mesin ini"""
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def serve(db_path=QUEUE_DB, port=QUEUE_PORT, host='127.0.0.1'):
+    """Layanan HTTP di depan file antrian agar worker dari mesin lain bisa lease/lapor"""
+    if is_remote(db_path):
+        print(f"🚨 Layanan antrian butuh file SQLite lokal, bukan URL: {db_path}")
+        return
+    # Hasil antrian berisi nama, email, dan publikasi, jadi akses jaringan wajib pakai token
+    if not is_loopback(host) and not QUEUE_TOKEN:
+        print(f"🚨 Isi ANTRIAN_TOKEN sebelum membuka layanan antrian di {host}")
+        return
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            token = self.headers.get('X-Antrian-Token', '')
+            if QUEUE_TOKEN and not hmac.compare_digest(token.encode('utf-8'), QUEUE_TOKEN.encode('utf-8')):
+                return self._reply(403, {'error': 'token salah'})
+            action = ACTIONS.get(self.path.strip('/'))
+            if action is None:
+                return self._reply(404, {'error': f"aksi tidak dikenal: {self.path}"})
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                args = json.loads(self.rfile.read(length) or b'{}')
+                self._reply(200, action(db_path=db_path, **args))
+            except Exception as e:
+                self._reply(500, {'error': str(e)})
+
+        def _reply(self, status, payload):
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    connect(db_path).close()
+    print(f"🛰️  Layanan antrian {db_path} berjalan di http://{host}:{port}")
+    HTTPServer((host, port), Handler).serve_forever()
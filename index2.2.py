@@ -1,11 +1,18 @@
+import os
+import sys
 import time
 import random
+import socket
+import sqlite3
 import pandas as pd
 import re
 from scholarly import scholarly
 from rapidfuzz import fuzz, process
 from scholarly import ProxyGenerator
 
+import MetadataEnrich
+import WorkQueue
+
 # Konfigurasi
 TARGET_AFFILIATIONS = [
     "Universitas Islam Negeri Sunan Kalijaga",
@@ -85,6 +92,11 @@ def parse_authors(authors_str):
     return re.split(r', | and | & ', authors_str.strip())
 
 
+def citation_venue(citation):
+    """Ambil nama jurnal/konferensi dari string citation Scholar, misal 'Jurnal X 5 (2), 12-20, 2020'"""
+    return re.split(r'\s+\d+\s*\(|\s+\d+\s*,|,\s*\d', citation or '')[0].strip(' ,')
+
+
 def check_author_match(owner_name, authors_list):
     """Cek apakah owner_name ada di list penulis"""
     for author in authors_list:
@@ -93,7 +105,7 @@ def check_author_match(owner_name, authors_list):
     return False
 
 
-def process_profile(scholar_id):
+def process_profile(scholar_id, heartbeat=None):
     """Proses satu profil dan publikasinya dengan deteksi publikasi meragukan"""
     print(f"\n📖 Memproses profil {scholar_id}")
     try:
@@ -104,17 +116,35 @@ def process_profile(scholar_id):
         return None
 
     results = []
+    gagal = 0
     owner_name = author.get('name', '')
     pub_count = min(len(author['publications']), MAX_PUBLICATIONS)
 
     print(f"   🔎 Memeriksa {pub_count} publikasi...")
     for i, pub in enumerate(author['publications'][:pub_count]):
+        # Worker antrian memperpanjang lease tiap publikasi
+        if heartbeat:
+            heartbeat()
         try:
-            publication = scholarly.fill(pub)
-            time.sleep(random.uniform(*REQUEST_DELAY))
+            # Penulis lengkap dari mirror metadata jika ada, tanpa fill per publikasi.
+            # Jurnal tetap dari Scholar (venue dari citation) agar cek afiliasi tidak bergantung cache;
+            # baris ini ditandai lewat kolom 'Sumber Penulis'.
+            bib = pub.get('bib', {})
+            cached = MetadataEnrich.lookup(title=bib.get('title'), year=bib.get('pub_year'))
+            if cached:
+                bib = dict(bib)
+                bib.setdefault('journal', citation_venue(bib.get('citation', '')))
+                authors = cached['authors']
+                doi = cached['doi']
+                sumber = f"Mirror ({cached['source']})"
+            else:
+                publication = scholarly.fill(pub)
+                time.sleep(random.uniform(*REQUEST_DELAY))
 
-            bib = publication.get('bib', {})
-            authors = parse_authors(bib.get('author', ''))
+                bib = publication.get('bib', {})
+                authors = parse_authors(bib.get('author', ''))
+                doi = MetadataEnrich.normalize_doi(publication.get('pub_url', ''))
+                sumber = 'Scholar'
 
             nama_cocok = check_author_match(owner_name, authors)
             afiliasi_cocok = any(fuzz.partial_ratio(affil.lower(), bib.get('journal', '').lower()) > 75
@@ -125,26 +155,28 @@ def process_profile(scholar_id):
                 'authors': ', '.join(authors),
                 'year': bib.get('year', ''),
                 'journal': bib.get('journal', ''),
+                'doi': doi or '',
+                'sumber': sumber,
                 'nama_cocok': 'YA' if nama_cocok else 'TIDAK',
                 'afiliasi_cocok': 'YA' if afiliasi_cocok else 'TIDAK',
                 'status': 'MERAGUKAN' if not nama_cocok or not afiliasi_cocok else 'VALID'
             })
         except Exception as e:
             print(f"    🚨 Gagal memproses publikasi {i + 1}: {str(e)}")
+            gagal += 1
 
     return {
         'scholar_id': scholar_id,
         'nama': owner_name,
         'afiliasi': author.get('affiliation', ''),
         'email': author.get('email', ''),
-        'publikasi': results
+        'publikasi': results,
+        'gagal': gagal
     }
 
 
-def start():
-    """Fungsi utama untuk menjalankan proses"""
-    excluded_names = load_excluded_names("Kecuali9.xlsx")
-
+def discover_scholar_ids(excluded_names):
+    """Ambil dan filter kandidat, kembalikan daftar scholar_id yang valid"""
     # Langkah 1: Ambil semua kandidat
     all_candidates = []
     for affiliation in TARGET_AFFILIATIONS:
@@ -155,37 +187,44 @@ def start():
     valid_profiles = filter_profiles(all_candidates, excluded_names)
     scholar_ids = list({p['scholar_id'] for p in valid_profiles})
     print(f"\n🔍 Ditemukan {len(scholar_ids)} profil valid")
+    return scholar_ids
+
+
+def profile_rows(sid, profile_data):
+    """Ubah hasil process_profile menjadi baris-baris untuk Excel"""
+    rows = []
+    if profile_data and profile_data['publikasi']:
+        for pub in profile_data['publikasi']:
+            rows.append({
+                'ID Scholar': sid,
+                'Nama': profile_data['nama'],
+                'Afiliasi Profil': profile_data['afiliasi'],
+                'Email': profile_data['email'],
+                'Judul Publikasi': pub['title'],
+                'Penulis': pub['authors'],
+                'Tahun': pub['year'],
+                'Journal/Conference': pub['journal'],
+                'DOI': pub['doi'],
+                'Sumber Penulis': pub['sumber'],
+                'Kesesuaian Nama': pub['nama_cocok'],
+                'Kesesuaian Afiliasi': pub['afiliasi_cocok'],
+                'Status': pub['status']
+            })
+    return rows
 
-    # Langkah 3: Proses setiap profil
-    final_data = []
-    for sid in scholar_ids:
-        profile_data = process_profile(sid)
-        if profile_data and profile_data['publikasi']:
-            for pub in profile_data['publikasi']:
-                final_data.append({
-                    'ID Scholar': sid,
-                    'Nama': profile_data['nama'],
-                    'Afiliasi Profil': profile_data['afiliasi'],
-                    'Email': profile_data['email'],
-                    'Judul Publikasi': pub['title'],
-                    'Penulis': pub['authors'],
-                    'Tahun': pub['year'],
-                    'Journal/Conference': pub['journal'],
-                    'Kesesuaian Nama': pub['nama_cocok'],
-                    'Kesesuaian Afiliasi': pub['afiliasi_cocok'],
-                    'Status': pub['status']
-                })
-        time.sleep(random.uniform(*REQUEST_DELAY))
 
-    # Langkah 4: Simpan ke Excel
+def save_results(final_data, output_file):
+    """Simpan hasil ke Excel dan cetak statistik"""
     df = pd.DataFrame(final_data)
+    if df.empty:
+        print("\n⚠️  Tidak ada publikasi untuk disimpan")
+        return df
 
     # Urutkan berdasarkan status meragukan
     df = df.sort_values(by=['Status', 'Kesesuaian Nama', 'Kesesuaian Afiliasi'],
                         ascending=[True, False, False])
 
     # Simpan ke file Excel
-    output_file = "deteksi6.xlsx"
     df.to_excel(output_file, index=False)
 
     # Hitung statistik
@@ -197,7 +236,184 @@ def start():
     print(f"Publikasi Valid: {total_pub - meragukan}")
     print(f"Publikasi Meragukan: {meragukan}")
     print(f"\nFile hasil disimpan di: {output_file}")
+    return df
+
+
+def start():
+    """Fungsi utama untuk menjalankan proses"""
+    excluded_names = load_excluded_names("Kecuali9.xlsx")
+
+    # Langkah 1-2: Ambil dan filter kandidat
+    scholar_ids = discover_scholar_ids(excluded_names)
+
+    # Langkah 3: Proses setiap profil
+    final_data = []
+    for sid in scholar_ids:
+        profile_data = process_profile(sid)
+        final_data.extend(profile_rows(sid, profile_data))
+        time.sleep(random.uniform(*REQUEST_DELAY))
+
+    # Langkah 4: Simpan ke Excel
+    save_results(final_data, "deteksi6.xlsx")
+
+
+def start_queue(excluded_file=None, db_path=WorkQueue.QUEUE_DB):
+    """Mode antrian: hasil discovery dimasukkan ke antrian bersama"""
+    excluded_names = load_excluded_names(excluded_file) if excluded_file else set()
+    scholar_ids = discover_scholar_ids(excluded_names)
+    added = WorkQueue.enqueue(scholar_ids, db_path)
+    print(f"\n📥 {added} profil baru masuk antrian ({len(scholar_ids) - added} sudah ada)")
+    print(f"Status antrian: {WorkQueue.queue_stats(db_path)}")
+
+
+def run_worker(worker_id=None, db_path=WorkQueue.QUEUE_DB):
+    """Mode antrian: ambil profil dari antrian sampai habis dan laporkan hasilnya"""
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    print(f"\n👷 Worker {worker_id} mulai")
+    gagal_beruntun = 0
+    while True:
+        # Worker yang terus gagal (misal kena CAPTCHA) menunggu makin lama
+        if gagal_beruntun:
+            jeda = WorkQueue.backoff(gagal_beruntun)
+            print(f"   ⏳ {gagal_beruntun} kegagalan beruntun, menunggu {jeda} detik")
+            time.sleep(jeda)
+
+        try:
+            sid = WorkQueue.lease(worker_id, db_path)
+            if sid is None:
+                if not WorkQueue.queue_stats(db_path).get('pending'):
+                    break
+                # Masih ada item yang menunggu backoff
+                time.sleep(WorkQueue.BACKOFF_BASE)
+                continue
+        except (sqlite3.OperationalError, OSError) as e:
+            print(f"   🚨 Antrian tidak bisa diakses, mencoba lagi: {str(e)}")
+            time.sleep(random.uniform(*REQUEST_DELAY))
+            continue
+
+        def heartbeat():
+            try:
+                if not WorkQueue.renew(sid, worker_id, db_path):
+                    raise WorkQueue.LeaseLost(f"Lease {sid} sudah diambil worker lain")
+            except (sqlite3.OperationalError, OSError) as e:
+                print(f"   ⚠️  Gagal memperpanjang lease {sid}: {str(e)}")
+
+        try:
+            profile_data = process_profile(sid, heartbeat)
+            # Profil diulang hanya jika tidak termuat sama sekali (semua publikasi gagal
+            # juga dihitung tidak termuat, biasanya tanda kena CAPTCHA)
+            if profile_data is None or (profile_data['gagal'] and not profile_data['publikasi']):
+                print(f"   ⚠️  {sid} dikembalikan ke antrian: gagal memuat profil")
+                WorkQueue.fail(sid, worker_id, "Gagal memuat profil", db_path)
+                gagal_beruntun += 1
+            else:
+                # Sebagian publikasi gagal: hasil tetap disimpan dengan catatan
+                error = f"{profile_data['gagal']} publikasi gagal diproses" if profile_data['gagal'] else None
+                rows = profile_rows(sid, profile_data)
+                for row in rows:
+                    row['Catatan Antrian'] = error or ''
+                if not WorkQueue.complete(sid, worker_id, rows, db_path, error):
+                    print(f"   ⚠️  Lease {sid} sudah kedaluwarsa, hasil dibuang")
+                elif error:
+                    print(f"   ⚠️  {sid} disimpan sebagian: {error}")
+                gagal_beruntun = 0
+        except WorkQueue.LeaseLost as e:
+            # Worker lambat, bukan gagal: item sudah dipegang worker lain
+            print(f"   ⚠️  {str(e)}, item dilewati")
+        except Exception as e:
+            print(f"   🚨 Gagal memproses {sid}: {str(e)}")
+            gagal_beruntun += 1
+            try:
+                WorkQueue.fail(sid, worker_id, e, db_path)
+            except (sqlite3.OperationalError, OSError):
+                pass  # Lease akan kedaluwarsa dan item kembali ke antrian
+        time.sleep(random.uniform(*REQUEST_DELAY))
+    print(f"\n✅ Antrian habis. Status antrian: {WorkQueue.queue_stats(db_path)}")
+
+
+def reset_queue(include_partial=False, db_path=WorkQueue.QUEUE_DB):
+    """Mode antrian: kembalikan item yang gagal (dan opsional yang sebagian) ke antrian"""
+    print(f"\n🔁 {WorkQueue.reset_failed(db_path, include_partial)} item dikembalikan ke antrian")
+    print(f"Status antrian: {WorkQueue.queue_stats(db_path)}")
+
+
+def export_queue(output_file="deteksi_antrian.xlsx", db_path=WorkQueue.QUEUE_DB):
+    """Mode antrian: gabungkan hasil semua worker ke satu file Excel"""
+    print(f"Status antrian: {WorkQueue.queue_stats(db_path)}")
+    save_results(WorkQueue.collect_results(db_path), output_file)
+
+
+def enrich_results(input_file, output_file=None, source=MetadataEnrich.crossref_source):
+    """Perkaya daftar penulis hasil run lewat sumber metadata, lalu hitung ulang kecocokan nama"""
+    if not output_file:
+        stem, ext = os.path.splitext(input_file)
+        output_file = f"{stem}_diperkaya{ext or '.xlsx'}"
+    if os.path.abspath(output_file) == os.path.abspath(input_file):
+        print("🚨 File output tidak boleh sama dengan file input")
+        return None
+
+    df = pd.read_excel(input_file).fillna('')
+    rows = df.to_dict('records')
+    for row in rows:
+        # Simpan string penulis asli dari Scholar di kolom terpisah
+        row['Penulis Scholar'] = row.get('Penulis Scholar') or row['Penulis']
+    items = [{'doi': row.get('DOI', ''), 'title': row['Judul Publikasi'], 'year': row['Tahun'],
+              'authors': parse_authors(str(row['Penulis Scholar']))}
+             for row in rows]
+    resolved = MetadataEnrich.resolve(items, source)
+
+    final_data = []
+    diperkaya = 0
+    ditolak = 0
+    for row, item in zip(rows, items):
+        record = resolved.get(MetadataEnrich.item_key(item))
+        # DOI/judul yang salah tidak boleh menimpa penulis Scholar yang benar
+        if record and not MetadataEnrich.authors_consistent(item['authors'], record['authors']):
+            ditolak += 1
+            record = None
+        if record:
+            nama_cocok = check_author_match(row['Nama'], record['authors'])
+            row['Penulis'] = ', '.join(record['authors'])
+            row['DOI'] = row.get('DOI') or record['doi'] or ''
+            row['Sumber Penulis'] = f"Mirror ({record['source']})"
+            row['Kesesuaian Nama'] = 'YA' if nama_cocok else 'TIDAK'
+            row['Status'] = ('MERAGUKAN' if not nama_cocok or row['Kesesuaian Afiliasi'] != 'YA'
+                             else 'VALID')
+            diperkaya += 1
+        final_data.append(row)
+
+    print(f"\n📚 {diperkaya} dari {len(final_data)} publikasi diperkaya dengan penulis lengkap "
+          f"({ditolak} hasil ditolak karena penulis tidak konsisten)")
+    return save_results(final_data, output_file)
 
 
 if __name__ == "__main__":
-    start()
\ No newline at end of file
+    # Tanpa argumen: proses biasa dalam satu proses
+    # layani-antrian [port] [host]: layanan HTTP antrian untuk worker di mesin lain (ANTRIAN=http://host:port),
+    #   default hanya 127.0.0.1; host lain (misal 0.0.0.0) wajib dengan ANTRIAN_TOKEN
+    # isi-antrian [Kecuali.xlsx] | worker [id] | ulang-antrian [parsial] | ekspor [file.xlsx]: mode antrian
+    # perkaya file.xlsx [output.xlsx] [dump.json|dump.db]: enrichment penulis via CrossRef atau dump lokal
+    mode = sys.argv[1] if len(sys.argv) > 1 else ''
+    if mode == 'layani-antrian':
+        WorkQueue.serve(WorkQueue.QUEUE_DB,
+                        int(sys.argv[2]) if len(sys.argv) > 2 else WorkQueue.QUEUE_PORT,
+                        *sys.argv[3:4])
+    elif mode == 'isi-antrian':
+        start_queue(*sys.argv[2:3])
+    elif mode == 'worker':
+        run_worker(sys.argv[2] if len(sys.argv) > 2 else None)
+    elif mode == 'ulang-antrian':
+        reset_queue(sys.argv[2:3] == ['parsial'])
+    elif mode == 'ekspor':
+        export_queue(*sys.argv[2:3])
+    elif mode == 'perkaya':
+        output_file = None
+        source = MetadataEnrich.crossref_source
+        for arg in sys.argv[3:]:
+            if arg.lower().endswith('.xlsx'):
+                output_file = arg
+            else:
+                source = MetadataEnrich.make_dump_source(arg)
+        enrich_results(sys.argv[2], output_file, source)
+    else:
+        start()